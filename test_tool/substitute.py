@@ -2,12 +2,17 @@
 This module contains the functions to substitute variables.
 """
 from logging import getLogger
-from re import findall, search, sub
+from re import compile as compile_pattern
 from typing import Any, Callable, Dict, List, Optional, Union
 
 # Get the logger
 test_tool_logger = getLogger("test-tool")
 
+# Variables are defined as {{foo.bar[0]}}
+VARIABLE_PATTERN = compile_pattern(r"{{[a-zA-Z0-9\_\-\.\[\]\|\:\ ]+}}")
+# List index at the end of a key, like bar[0]
+LIST_PATTERN = compile_pattern(r"\[(-?\d+)\]$")
+
 # Define the pipes
 available_pipes: Dict[str, Callable] = {
     "int": int,
@@ -36,11 +41,14 @@ def replace_string_variables(
     Optional[str]
         The changed string if it was changed, None otherwise.
     """
+    # Most strings contain no variables at all
+    if "{{" not in to_change:
+        return None
+
     changed: Any = to_change
 
-    # Find all variables in the string. Variables are defined as {{foo.bar[0]}}
-    pattern = r"{{[a-zA-Z0-9\_\-\.\[\]\|\:\ ]+}}"
-    variables = findall(pattern, changed)
+    # Find all variables in the string
+    variables = VARIABLE_PATTERN.findall(changed)
     # Replace the variables with the data, if possible
     for variable in variables:
         # Remove {{ and }}
@@ -55,17 +63,16 @@ def replace_string_variables(
         pipes = pipes[1:]
         # Split for objects
         keys = var.split(".")
-        # Check if path is list
-        list_pattern = r"\[(-?\d+)\]$"
         # Keep track for logging
         log_path = "data"
         # Get the value
         value: Union[Dict[str, Any], List[Any], str] = data
         for key in keys:
-            is_list = search(list_pattern, key)
+            # Check if path is list
+            is_list = LIST_PATTERN.search(key)
             if is_list:
                 list_key = int(is_list.group(1))
-                key = sub(list_pattern, "", key)
+                key = key[: is_list.start()]
             try:
                 value = value[key]
             except KeyError as e:
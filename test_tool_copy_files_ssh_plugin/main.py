@@ -1,13 +1,42 @@
 """
 Module for copying files over SSH.
 """
+import atexit
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from logging import debug, error, info
+from os import makedirs, scandir
 from pathlib import Path
+from posixpath import dirname
+from queue import Empty, Queue
+from shutil import copyfileobj
 from stat import S_ISDIR
-from typing import Any, Callable, Dict, TypedDict, List
+from typing import Any, Callable, Deque, Dict, TypedDict, List, Set, Tuple
 from glob import glob
 
-from paramiko import AutoAddPolicy, SSHClient
+from paramiko import AutoAddPolicy, SFTPClient, SSHClient
+
+# Number of SFTP channels used in parallel for multiple files
+SFTP_CHANNELS = 8
+
+# Block size for writing downloaded files to the local disk
+LOCAL_BLOCK_SIZE = 1 << 20
+
+
+class _SftpSession(TypedDict):
+    """
+    The SFTP session of a connection, with the remote directories created.
+    """
+    sftp: SFTPClient
+    # Additional channels for parallel transfers, opened when needed
+    channels: List[SFTPClient]
+    created: Set[str]
+
+
+# Open connections, reused by all calls to the same user and host
+_clients: Dict[Tuple[str, str], SSHClient] = {}
+_sftp_clients: Dict[SSHClient, _SftpSession] = {}
 
 
 class CopyFilesSshCall(TypedDict):
@@ -32,9 +61,37 @@ default_copy_files_ssh_call: CopyFilesSshCall = {
 }
 
 
-def run_with_ssh_client(
-    user: str, host: str, password: str, call: Callable[[SSHClient], None]
-) -> None:
+def _close_sftp_session(session: _SftpSession) -> None:
+    for channel in session["channels"]:
+        channel.close()
+    session["sftp"].close()
+
+
+def _close_client(client: SSHClient) -> None:
+    session = _sftp_clients.pop(client, None)
+    if session is not None:
+        _close_sftp_session(session)
+    client.close()
+
+
+def _close_all_clients() -> None:
+    for client in _clients.values():
+        _close_client(client)
+    _clients.clear()
+
+
+atexit.register(_close_all_clients)
+
+
+def _get_client(user: str, host: str, password: str) -> SSHClient:
+    # Reuse the connection while it is alive
+    client = _clients.get((user, host))
+    if client is not None:
+        transport = client.get_transport()
+        if transport is not None and transport.is_active():
+            return client
+        _close_client(client)
+
     # Create an SSH client
     info(f"Connect to {user}@{host}")
     client = SSHClient()
@@ -42,55 +99,188 @@ def run_with_ssh_client(
     # Automatically add the server's host key
     client.set_missing_host_key_policy(AutoAddPolicy())
 
+    # Connect to the remote server
     try:
-        # Connect to the remote server
         client.connect(host, username=user, password=password)
-
-        # Run the callable
-        call(client)
-    finally:
-        # Close the SSH connection
+    except Exception:
         client.close()
+        raise
+
+    _clients[(user, host)] = client
+    return client
+
+
+def _get_sftp_session(client: SSHClient) -> _SftpSession:
+    # Keep one SFTP session open per client
+    session = _sftp_clients.get(client)
+    if session is None or session["sftp"].get_channel().closed:  # type: ignore
+        if session is not None:
+            _close_sftp_session(session)
+        session = {
+            "sftp": client.open_sftp(),
+            "channels": [],
+            "created": set(),
+        }
+        _sftp_clients[client] = session
+    return session
+
+
+def run_with_sftp_channels(
+    session: _SftpSession, jobs: List[Callable[[SFTPClient], None]]
+) -> None:
+    workers = min(SFTP_CHANNELS, len(jobs))
+    if workers == 0:
+        return
+    sftp = session["sftp"]
+    transport = sftp.get_channel().get_transport()  # type: ignore
+
+    # Reuse the channels of earlier calls which are still open
+    channels = session["channels"]
+    channels[:] = [c for c in channels if not c.get_channel().closed]
+
+    # Every job borrows an idle channel for the duration of the transfer
+    idle: Queue[SFTPClient] = Queue()
+    for channel in [sftp, *channels]:
+        idle.put(channel)
 
+    def run(job: Callable[[SFTPClient], None]) -> None:
+        # All channels are busy, open another one on the same transport
+        try:
+            channel = idle.get_nowait()
+        except Empty:
+            channel = SFTPClient.from_transport(transport)  # type: ignore
+            channels.append(channel)
+        try:
+            job(channel)
+        finally:
+            idle.put(channel)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(run, job) for job in jobs]:
+            future.result()
+
+
+def make_remote_dir(
+    sftp: SFTPClient, remote_path: str, created: Set[str]
+) -> None:
+    # Directories created earlier on the same session
+    if remote_path in created:
+        return
+
+    # Paramiko raises an IOError if the directory already exists, any other
+    # error is reported by the upload into the directory
+    try:
+        sftp.mkdir(remote_path)
+    except IOError:
+        pass
+    created.add(remote_path)
 
-def upload_directory(local_path: Path, remote_path: Path, sftp):
+
+def upload_file(
+    sftp: SFTPClient, local_path: str, remote_path: str, created: Set[str]
+) -> None:
+    # Skip the stat after the upload
+    try:
+        sftp.put(local_path, remote_path, confirm=False)
+    except Exception:
+        # Create the directory again with the next upload
+        created.discard(dirname(remote_path))
+        raise
+
+
+def download_file(
+    sftp: SFTPClient, remote_path: str, local_path: str, size: int
+) -> None:
+    with sftp.open(remote_path, "rb") as remote_file:
+        # Pipeline the read requests
+        remote_file.prefetch(size)
+        with open(local_path, "wb") as local_file:
+            copyfileobj(remote_file, local_file, LOCAL_BLOCK_SIZE)
+
+
+def upload_directory(
+    local_path: Path, remote_path: Path, session: _SftpSession
+):
     debug(
         f"Upload directory {local_path.as_posix()} to {remote_path.as_posix()}"
     )
-    try:
+    sftp = session["sftp"]
+    created = session["created"]
+    jobs: List[Callable[[SFTPClient], None]] = []
+
+    # Paths are passed as strings, to avoid building Path objects per file
+    def collect(local_dir: str, remote_dir: str) -> None:
         # Create the remote directory if it doesn't exist
-        try:
-            sftp.stat(remote_path.as_posix())
-        except FileNotFoundError:
-            sftp.mkdir(remote_path.as_posix())
-
-        # Upload the files in the local directory
-        for item in local_path.iterdir():
-            if item.is_file():
-                sftp.put(
-                    item.as_posix(), remote_path.joinpath(item.name).as_posix()
-                )
-            elif item.is_dir():
-                upload_directory(remote_path.joinpath(item.name), item, sftp)
+        make_remote_dir(sftp, remote_dir, created)
+
+        # Collect the files in the local directory
+        with scandir(local_dir) as items:
+            for item in items:
+                remote_item = f"{remote_dir}/{item.name}"
+                if item.is_file():
+                    jobs.append(
+                        partial(
+                            upload_file,
+                            local_path=f"{local_dir}/{item.name}",
+                            remote_path=remote_item,
+                            created=created,
+                        )
+                    )
+                elif item.is_dir():
+                    collect(f"{local_dir}/{item.name}", remote_item)
+
+    try:
+        collect(local_path.as_posix(), remote_path.as_posix())
+        run_with_sftp_channels(session, jobs)
     except FileNotFoundError as e:
         raise ValueError(f"Local directory '{local_path}' not found.") from e
     except Exception as e:
         print(f"Error uploading directory: {e}")
 
 
-def download_directory(remote_path: Path, local_path: Path, sftp):
+def download_directory(
+    remote_path: Path, local_path: Path, session: _SftpSession
+):
     debug(
         f"Download directory {remote_path.as_posix()} to {local_path.as_posix()}"
     )
-    for item in sftp.listdir_attr(remote_path.as_posix()):
-        remote_item = remote_path.joinpath(item.filename)
-        local_item = local_path.joinpath(item.filename)
+    sftp = session["sftp"]
+    jobs: List[Callable[[SFTPClient], None]] = []
+    # Local directories without sub directories, in breadth first order
+    leaves: List[str] = []
 
-        if S_ISDIR(item.st_mode):
-            local_item.mkdir(parents=True, exist_ok=True)
-            download_directory(remote_item, local_item, sftp)
-        else:
-            sftp.get(remote_item.as_posix(), local_item.as_posix())
+    # Walk the remote tree breadth first, one listing per directory
+    directories: Deque[Tuple[str, str]] = deque(
+        [(remote_path.as_posix(), local_path.as_posix())]
+    )
+    while directories:
+        remote_dir, local_dir = directories.popleft()
+        is_leaf = True
+        for item in sftp.listdir_attr(remote_dir):
+            remote_item = f"{remote_dir}/{item.filename}"
+            local_item = f"{local_dir}/{item.filename}"
+
+            if S_ISDIR(item.st_mode):
+                is_leaf = False
+                directories.append((remote_item, local_item))
+            else:
+                jobs.append(
+                    partial(
+                        download_file,
+                        remote_path=remote_item,
+                        local_path=local_item,
+                        size=item.st_size,
+                    )
+                )
+        if is_leaf:
+            leaves.append(local_dir)
+
+    # Create the local tree, the parents are created with the leaves
+    for leaf in leaves:
+        makedirs(leaf, exist_ok=True)
+
+    # Download the files in parallel
+    run_with_sftp_channels(session, jobs)
 
 
 def copy_remote_file(
@@ -100,63 +290,66 @@ def copy_remote_file(
     download: bool = False,
 ) -> None:
     # Use SFTP to copy the file
-    with client.open_sftp() as sftp:
-        if not download:
-            info(
-                f"Copy the file {local_path.as_posix()} to {remote_path.as_posix()}"
-            )
-            # Create the remote directory if it doesn't exist
-            try:
-                sftp.stat(remote_path.as_posix())
-            except FileNotFoundError:
-                sftp.mkdir(remote_path.as_posix())
-
-            # Copy the file
-            files: List[str] = glob(local_path.as_posix())
-            for file in files:
-                local_file: Path = Path(file)
-                if local_file.is_dir():
-                    error("Can not copy a directory from local to remote")
-                    # TODO: Test
-                    # upload_directory(remote_path, local_path, sftp)
-                    assert False
-                elif local_file.is_file():
-                    sftp.put(
-                        local_file,
-                        remote_path.joinpath(local_file.name).as_posix(),
+    session = _get_sftp_session(client)
+    sftp = session["sftp"]
+    if not download:
+        info(
+            f"Copy the file {local_path.as_posix()} to {remote_path.as_posix()}"
+        )
+        # Create the remote directory if it doesn't exist
+        make_remote_dir(sftp, remote_path.as_posix(), session["created"])
+
+        # Copy the file
+        files: List[str] = glob(local_path.as_posix())
+        jobs: List[Callable[[SFTPClient], None]] = []
+        for file in files:
+            local_file: Path = Path(file)
+            if local_file.is_dir():
+                error("Can not copy a directory from local to remote")
+                # TODO: Test
+                # upload_directory(local_path, remote_path, session)
+                assert False
+            elif local_file.is_file():
+                jobs.append(
+                    partial(
+                        upload_file,
+                        local_path=local_file.as_posix(),
+                        remote_path=remote_path.joinpath(
+                            local_file.name
+                        ).as_posix(),
+                        created=session["created"],
                     )
-                else:
-                    error(f"File {file} is not a file or directory")
-                    assert False
+                )
+            else:
+                error(f"File {file} is not a file or directory")
+                assert False
+        run_with_sftp_channels(session, jobs)
+    else:
+        info(
+            f"Copy the file {remote_path.as_posix()} to {local_path.as_posix()}"
+        )
+        # Copy the file
+        if S_ISDIR(sftp.stat(remote_path.as_posix()).st_mode):
+            download_directory(remote_path, local_path, session)
         else:
-            info(
-                f"Copy the file {remote_path.as_posix()} to {local_path.as_posix()}"
-            )
             # Create the local directory if it doesn't exist
             local_path.mkdir(parents=True, exist_ok=True)
-
-            # Copy the file
-            if S_ISDIR(sftp.stat(remote_path.as_posix()).st_mode):
-                download_directory(remote_path, local_path, sftp)
-            else:
-                sftp.get(
-                    remote_path.as_posix(),
-                    local_path.joinpath(remote_path.name).as_posix(),
-                )
+            sftp.get(
+                remote_path.as_posix(),
+                local_path.joinpath(remote_path.name).as_posix(),
+            )
 
 
 def make_copy_files_ssh_call(
     call: CopyFilesSshCall,
     data: Dict[str, Any],  # pylint: disable=unused-argument
 ) -> None:
-    # Run the cmd with client
-    run_with_ssh_client(
-        call["user"],
-        call["host"],
-        call["password"],
-        lambda client: copy_remote_file(
-            client, call["local_path"], call["remote_path"], call["download"]
-        ),
+    # Copy with the cached client
+    copy_remote_file(
+        _get_client(call["user"], call["host"], call["password"]),
+        call["local_path"],
+        call["remote_path"],
+        call["download"],
     )
 
 
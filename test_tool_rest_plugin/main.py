@@ -2,14 +2,27 @@
 This is the main file of the plugin. It is called by the test tool and
 contains the main function.
 """
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from enum import Enum
+from http.cookiejar import DefaultCookiePolicy
 import json
 from logging import error, info
 from pathlib import Path
-from typing import IO, Any, Dict, List, Optional, Tuple, TypedDict
+from re import compile as compile_pattern
+import socket
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict
 from xml.dom.minidom import parseString
 
-from requests import delete, get, post, put
+import orjson
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+try:
+    from lxml import etree
+except ImportError:  # pragma: no cover
+    etree = None  # type: ignore
 
 
 class Assertion(TypedDict):
@@ -127,8 +140,8 @@ class File(TypedDict):
     media: str
 
 
-LoadedFile = Tuple[str, IO[Any], str]
-EmptyFile = Tuple[None, str, str]
+# Name, resolved path, media and binary flag, opened when the call is made
+LoadedFile = Tuple[str, Path, str, bool]
 
 
 class RestCall(TypedDict):
@@ -143,8 +156,8 @@ class RestCall(TypedDict):
     # Request
     method: Method
     body: Optional[Body]
-    files: Optional[Dict[str, File | LoadedFile | EmptyFile]]
-    multipart: Optional[Dict[str, Tuple[None, str, str]]]
+    files: Optional[Dict[str, File | LoadedFile]]
+    multipart: Optional[Dict[str, Any]]
     # payload: Optional[Dict[str, str]]
     # To request
     timeout: int
@@ -200,40 +213,208 @@ default_request_body: Dict[str, Any] = {
     "value": None
 }
 
+# Options for pretty printed json
+_JSON_PRETTY = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+# Enable TCP keep-alive, so idle pooled connections are not dropped
+_SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+]
+for _option, _value in (
+    ("TCP_KEEPIDLE", 30),
+    ("TCP_KEEPINTVL", 10),
+    ("TCP_KEEPCNT", 3),
+):
+    if hasattr(socket, _option):
+        _SOCKET_OPTIONS.append(
+            (socket.IPPROTO_TCP, getattr(socket, _option), _value)
+        )
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """
+    This class represents an adapter with TCP keep-alive enabled.
+    """
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        kwargs["socket_options"] = _SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
+# Shared session, so connections are reused between calls
+_SESSION = Session()
+# Don't keep cookies, every call starts without them
+_SESSION.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+for _prefix in ("http://", "https://"):
+    _SESSION.mount(
+        _prefix, _KeepAliveAdapter(pool_connections=10, pool_maxsize=50)
+    )
+
+# Number of rest calls made in parallel by make_rest_calls
+_MAX_WORKERS = 10
+
+# Request function per method
+_METHOD_FN: Dict[Method, Callable[..., Response]] = {
+    Method.GET: _SESSION.get,
+    Method.POST: _SESSION.post,
+    Method.PUT: _SESSION.put,
+    Method.DELETE: _SESSION.delete,
+}
+
+
+# Integers orjson may parse as floats, from 19 digits on they can be below
+# -2**63 or above 2**64 - 1
+_BIG_INT = compile_pattern(rb"\d{19}")
+
+# Tags and the text between them
+_XML_TOKEN = compile_pattern(r"<[^>]*>?|[^<]+")
 
-def pretty_xml(string: str) -> str:
+
+def pretty_xml(string: str, canonical: bool = False) -> str:
     """
     Return a pretty printed xml string.
 
+    By default the string is indented tag by tag, without parsing it into
+    a tree. Set canonical to parse and serialize it with lxml or minidom.
+
     Parameters
     ----------
-    xml : str
+    string : str
         The xml string.
+    canonical : bool
+        Parse the xml instead of only indenting it.
 
     Returns
     -------
     str
         The pretty printed xml string.
     """
-    dom = parseString(string)
-    return dom.toprettyxml()
+    if canonical:
+        if etree is not None:
+            return etree.tostring(
+                etree.fromstring(string.encode()), pretty_print=True
+            ).decode()
+        dom = parseString(string)
+        return dom.toprettyxml()
+
+    lines: List[str] = []
+    depth = 0
+    # Keep text and the closing tag on the line of the opening tag
+    inline = False
+    for token in _XML_TOKEN.findall(string):
+        if token.startswith("</"):
+            depth = max(depth - 1, 0)
+            if inline:
+                lines[-1] += token
+            else:
+                lines.append("  " * depth + token)
+            inline = False
+        elif token.startswith("<"):
+            lines.append("  " * depth + token)
+            inline = not (
+                token.startswith(("<?", "<!")) or token.endswith("/>")
+            )
+            if inline:
+                depth += 1
+        elif token.strip():
+            if inline:
+                lines[-1] += token.strip()
+            else:
+                lines.append("  " * depth + token.strip())
+    return "\n".join(lines) + "\n"
 
 
-def pretty_json(string: str) -> str:
+def pretty_json(obj: Any) -> str:
     """
     Return a pretty printed json string.
 
     Parameters
     ----------
-    json : str
-        The json string.
+    obj : Any
+        The object to print as json.
 
     Returns
     -------
     str
         The pretty printed json string.
     """
-    return json.dumps(string, indent=2)
+    try:
+        return orjson.dumps(obj, option=_JSON_PRETTY).decode()
+    except TypeError:
+        # orjson can't serialize integers wider than 64 bits
+        return json.dumps(obj, indent=2)
+
+
+def dumps_json(obj: Any) -> bytes:
+    """
+    Return an object serialized as json.
+
+    Parameters
+    ----------
+    obj : Any
+        The object to serialize.
+
+    Returns
+    -------
+    bytes
+        The json encoded as UTF-8.
+    """
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # orjson can't serialize integers wider than 64 bits
+        return json.dumps(obj).encode()
+
+
+def loads_json(response: Response) -> Any:
+    """
+    Return the json of a response.
+
+    Parameters
+    ----------
+    response : Response
+        The response to parse.
+
+    Returns
+    -------
+    Any
+        The parsed json, None if the response is not json.
+    """
+    # orjson would turn the big integers into floats
+    if not _BIG_INT.search(response.content):
+        try:
+            return orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            pass
+
+    # requests also decodes a BOM and other encodings than UTF-8
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+# Type checks of the simple fields of a rest call
+_FIELD_TYPES: Tuple[Tuple[str, type, str], ...] = (
+    ("base_url", str, "Base URL must be a string."),
+    ("path", str, "Path must be a string."),
+    ("timeout", int, "Timeout must be an integer, set 0 to disable."),
+    ("verify", bool, "Verify must be a boolean."),
+    ("hide_logs", bool, "Hide logs must be a boolean."),
+    ("status_codes", list, "Status codes must be a list."),
+)
+
+# Fields given by name and converted to their enum
+_ENUM_FIELDS: Tuple[Tuple[str, Any, str], ...] = (
+    ("method", Method, "Method"),
+    ("response_type", Type, "Response type"),
+)
+
+# Pretty printer per response type
+_PRETTY_PRINTERS: Dict[Type, Callable[[Any], str]] = {
+    Type.XML: pretty_xml,
+    Type.JSON: pretty_json,
+}
 
 
 # def multipartify(
@@ -283,7 +464,7 @@ def assert_response(call: RestCall) -> None:
     """
     url = call["url"]
 
-    data: Dict = {"headers": call["headers"]}
+    data: Dict = {}
 
     # # Add payload as files
     # if call["payload"]:
@@ -292,39 +473,23 @@ def assert_response(call: RestCall) -> None:
     #     for key, value in call["payload"].items():
     #         call["files"][key] = value
 
-    # Add multipart as files
-    if call["multipart"]:
-        if call["files"] is None:
-            call["files"] = {}
-        if call["files"] is not None:
-            for key, value in call["multipart"].items():
-                call["files"][key] = value
-
-    # Add data or files
-    if call["files"]:
-        data["files"] = call["files"]
-        del data["headers"]["Content-Type"]
-
-    # Add timeout
-    if call["timeout"]:
-        data["timeout"] = call["timeout"]
-
     # Add verify
     data["verify"] = call["verify"]
 
     # Add body
-    if call["body"] and "data" in call["body"]:
+    body = call["body"]
+    if body and "data" in body:
         # Default body type
-        if "type" not in call["body"] or not call["body"]["type"]:
-            call["body"]["type"] = BodyType.TEXT_PLAIN
+        if "type" not in body or not body["type"]:
+            body["type"] = BodyType.TEXT_PLAIN
         else:
-            call["body"]["type"] = BodyType(call["body"]["type"])  # type: ignore
+            body["type"] = BodyType(body["type"])
 
         # Add body
-        if call["body"]["type"] == BodyType.APPLICATION_JSON:
-            data["json"] = call["body"]["data"]
-        elif call["body"]["type"] == BodyType.TEXT_PLAIN:
-            data["data"] = call["body"]["data"]
+        if body["type"] == BodyType.APPLICATION_JSON:
+            data["json"] = body["data"]
+        elif body["type"] == BodyType.TEXT_PLAIN:
+            data["data"] = body["data"]
         else:
             raise ValueError("Body type not supported.")
 
@@ -345,48 +510,83 @@ def assert_response(call: RestCall) -> None:
 
     # Make the call
     info(f'Make {call["method"].name} to {url}')
-    if call["method"] == Method.GET:
-        response = get(url, timeout=10, **data)
-    elif call["method"] == Method.POST:
-        response = post(url, timeout=10, **data)
-    elif call["method"] == Method.PUT:
-        response = put(url, timeout=10, **data)
-    elif call["method"] == Method.DELETE:
-        response = delete(url, timeout=10, **data)
+    with ExitStack() as stack:
+        # Open the files only for the duration of the request
+        files: Dict[str, Any] = {}
+        if call["files"]:
+            for key, file in call["files"].items():
+                name, file_path, media, binary = file  # type: ignore
+                open_file = stack.enter_context(
+                    open(file_path, "rb" if binary else "r")
+                )
+                files[key] = (name, open_file, media)
+
+        # Add multipart as files, serialized only when the call is made
+        if call["multipart"]:
+            files.update(
+                (
+                    key,
+                    (
+                        None,
+                        dumps_json(part),
+                        "application/json",
+                    ),
+                )
+                for key, part in call["multipart"].items()
+            )
+
+        # Add files, requests sets the multipart Content-Type itself
+        headers = call["headers"]
+        if files:
+            data["files"] = files
+            headers = {
+                key: value
+                for key, value in headers.items()
+                if key.lower() != "content-type"
+            }
+        data["headers"] = headers
+
+        response = _METHOD_FN[call["method"]](
+            url, timeout=call["timeout"] or 10, **data
+        )
+
+    # Parse the response once, None if it is not json
+    response_json = loads_json(response)
 
     info(f"Response Status: {response.status_code}")
     if call["hide_logs"] is False:
-        try:
-            info(f"Response:\n{json.dumps(response.json(), indent=2)}")
-        except json.JSONDecodeError:
+        if response_json is not None:
+            info(f"Response:\n{pretty_json(response_json)}")
+        else:
             info(f'Response: "{response.text}"')
 
     assert response.status_code in call["status_codes"]
 
     # Compare the response
-    if call["assertion"] is not None:
-        if isinstance(call["assertion"]["value"], str):
-            assert response.text == call["assertion"]["value"]
-        elif isinstance(call["assertion"]["value"], dict):
-            if call["assertion"]["only_defined"]:
-                response_json = response.json()
+    assertion = call["assertion"]
+    if assertion is not None:
+        expected = assertion["value"]
+        if isinstance(expected, str):
+            assert response.text == expected
+        elif isinstance(expected, dict):
+            if assertion["only_defined"]:
                 assert isinstance(response_json, dict)
-                for key, value in call["assertion"]["value"].items():
-                    try:
-                        msg = (
-                            f'Key "{key}": "{value}" not equal to '
-                            + f'"{response_json[key]}".'
-                        )
-                        assert response_json[key] == value, msg
-                    except KeyError:
-                        assert False, f'Key "{key}" not found in response.'
+                for key, value in expected.items():
+                    assert (
+                        key in response_json
+                    ), f'Key "{key}" not found in response.'
+                    actual = response_json[key]
+                    assert actual == value, (
+                        f'Key "{key}": "{value}" not equal to '
+                        + f'"{actual}".'
+                    )
             else:
-                assert response.json() == call["assertion"]
-        elif isinstance(call["assertion"]["value"], list):
-            assert response.json() == call["assertion"]
+                assert response_json == expected
+        elif isinstance(expected, list):
+            assert response_json == expected
         else:
             error(
-                f'Assertion type "{type(call["assertion"])}"'
+                f'Assertion type "{type(expected)}"'
                 + " not supported yet."
             )
             assert False
@@ -415,13 +615,35 @@ def make_rest_call(
     except AssertionError as e:
         # Log the expected response
         if call["assertion"] is not None:
-            if call["response_type"] == Type.XML:
-                error(f'Expexted:\n{pretty_xml(str(call["assertion"]))}')
-            elif call["response_type"] == Type.JSON:
-                error(f'Expexted:\n{pretty_json(str(call["assertion"]))}')
-            else:
-                error(f'Expexted:\n{call["assertion"]}')
-            raise e
+            pretty = _PRETTY_PRINTERS.get(call["response_type"], str)
+            error(f'Expexted:\n{pretty(call["assertion"]["value"])}')
+        raise e
+
+
+def make_rest_calls(calls: List[RestCall], data: Dict[str, Any]) -> None:
+    """
+    Make independent rest calls in parallel, sharing the connection pool.
+
+    Parameters
+    ----------
+    calls : List[RestCall]
+        The augmented rest calls.
+    data : Dict[str, Any]
+        The data from the test tool.
+
+    Raises
+    ------
+    AssertionError
+        If a response is not as expected, after all calls are finished.
+    """
+    with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(make_rest_call, call, data) for call in calls
+        ]
+
+    # Raise the first error
+    for future in futures:
+        future.result()
 
 
 def augment_rest_call(
@@ -439,13 +661,19 @@ def augment_rest_call(
     path : Path
         The project path.
     """
-    # Base URL
-    if not isinstance(call["base_url"], str):
-        raise ValueError("Base URL must be a string.")
-
-    # Path
-    if not isinstance(call["path"], str):
-        raise ValueError("Path must be a string.")
+    # Simple types
+    for key, field_type, msg in _FIELD_TYPES:
+        if not isinstance(call[key], field_type):  # type: ignore
+            raise ValueError(msg)
+
+    # Enums
+    for key, enum, name in _ENUM_FIELDS:
+        if not isinstance(call[key], str):  # type: ignore
+            raise ValueError(f"{name} must be a string.")
+        try:
+            call[key] = enum[call[key]]  # type: ignore
+        except KeyError as e:
+            raise ValueError(f"{name} is not supported.") from e
 
     # Augment the url
     if call["url"] is None:
@@ -453,57 +681,39 @@ def augment_rest_call(
     elif not isinstance(call["url"], str):
         raise ValueError("URL must be a string.")
 
-    # Method
-    if not isinstance(call["method"], str):
-        raise ValueError("Method must be a string.")
-    else:
-        try:
-            call["method"] = Method[call["method"]]
-        except KeyError as e:
-            raise ValueError("Method is not supported.") from e
-
     # Data
 
-    # Files
+    # Files, they are opened when the call is made
     if call["files"] is not None:
         for key, file in call["files"].items():
             if isinstance(file, dict):
-                if file["binary"]:
-                    file_type = "rb"
-                else:
-                    file_type = "r"
-                open_file = open(path.joinpath(file["path"]), file_type)
+                file_path = path.joinpath(file["path"])
+                if not file_path.is_file():
+                    raise ValueError(f"File {file_path} not found.")
                 call["files"][key] = (
                     file["path"],
-                    open_file,
+                    file_path,
                     file["media"],
+                    file["binary"],
                 )
             else:
                 raise ValueError("File is not a dict.")
-    # Multipart
-    if call["multipart"] is not None:
-        for key, part in call["multipart"].items():
-            call["multipart"][key] = (
-                None, json.dumps(part), "application/json")
+    # Multipart, the parts are serialized when the call is made
+    if call["multipart"] is not None and not isinstance(
+        call["multipart"], dict
+    ):
+        raise ValueError("Multipart must be a dict.")
 
     # Payload
     # if call['payload'] is not None:
     #     call["payload"] = multipartify(call["payload"])
 
-    # Timeout
-    if not isinstance(call["timeout"], int):
-        raise ValueError("Timeout must be an integer, set 0 to disable.")
-
     # Headers
     if call["headers"] is None:
         raise ValueError("Headers are requiered.")
     elif not isinstance(call["headers"], dict):
         raise ValueError("Headers must be a dict.")
 
-    # Verify
-    if not isinstance(call["verify"], bool):
-        raise ValueError("Verify must be a boolean.")
-
     # Cert
     if call["cert"] is not None:
         if call["cert"]["path"] is not None:
@@ -518,15 +728,6 @@ def augment_rest_call(
             if not isinstance(call["cert"]["key"], str):
                 raise ValueError("Cert key must be a string.")
 
-    # Response type
-    if not isinstance(call["response_type"], str):
-        raise ValueError("Response type must be a string.")
-    else:
-        try:
-            call["response_type"] = Type[call["response_type"]]
-        except KeyError as e:
-            raise ValueError("Response type is not supported.") from e
-
     # Assertion
     if call["assertion"] is not None:
         if not isinstance(call["assertion"], dict):
@@ -545,22 +746,12 @@ def augment_rest_call(
                 call["assertion"]["value"] is None):
             raise ValueError("Assertion value is requiered.")
 
-        if (not isinstance(call["assertion"]["value"], str)) and (
-            not isinstance(call["assertion"]["value"], dict)
-        ):
+        if not isinstance(call["assertion"]["value"], (str, dict)):
             raise ValueError("Assertion must be a string or a dict.")
 
-    # Hide logs
-    if not isinstance(call["hide_logs"], bool):
-        raise ValueError("Hide logs must be a boolean.")
-
     # Status codes
-    if not isinstance(call["status_codes"], list):
-        raise ValueError("Status codes must be a list.")
-    else:
-        for status_code in call["status_codes"]:
-            if not isinstance(status_code, int):
-                raise ValueError("Status codes must be integers.")
+    if not all(isinstance(code, int) for code in call["status_codes"]):
+        raise ValueError("Status codes must be integers.")
 
 
 def main() -> None:
@@ -0,0 +1,339 @@
+"""
+This module contains tests for the copy files SSH plugin.
+"""
+
+import os
+from io import FileIO
+from pathlib import Path
+from threading import current_thread
+from time import sleep
+from typing import Any, Dict, Generator, List, Optional, Set
+
+import pytest
+import test_tool_copy_files_ssh_plugin.main as copy_files_ssh
+from mock import MagicMock, patch
+from paramiko import SFTPAttributes, SFTPClient
+from test_tool_copy_files_ssh_plugin.main import (
+    _close_client,
+    _get_client,
+    copy_remote_file,
+    download_directory,
+    make_remote_dir,
+    run_with_sftp_channels,
+)
+
+
+class FakeSFTPFile(FileIO):
+    """
+    A fake remote file, remembering the prefetched size.
+    """
+
+    prefetched: Optional[int] = None
+
+    def prefetch(self, file_size: Optional[int] = None) -> None:
+        """
+        Prefetch the file.
+        """
+        self.prefetched = file_size
+
+
+class FakeSFTP:
+    """
+    A fake SFTP client, working on a local directory as remote side.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.closed = False
+        self.channel = MagicMock(closed=False)
+        self.uploaded: List[str] = []
+        self.requests: List[str] = []
+
+    def path(self, remote_path: str) -> str:
+        """
+        Return the local path of a remote path.
+        """
+        return str(self.root.joinpath(remote_path.lstrip("/")))
+
+    def get_channel(self) -> Any:
+        """
+        Return the channel of the client.
+        """
+        return self.channel
+
+    def mkdir(self, remote_path: str) -> None:
+        """
+        Create a remote directory.
+        """
+        self.requests.append("mkdir")
+        os.mkdir(self.path(remote_path))
+
+    def stat(self, remote_path: str) -> SFTPAttributes:
+        """
+        Stat a remote path.
+        """
+        self.requests.append("stat")
+        return SFTPAttributes.from_stat(os.stat(self.path(remote_path)))
+
+    def listdir_attr(self, remote_path: str) -> List[SFTPAttributes]:
+        """
+        List a remote directory.
+        """
+        items = []
+        for name in os.listdir(self.path(remote_path)):
+            item = self.stat(f"{remote_path}/{name}")
+            item.filename = name
+            items.append(item)
+        return items
+
+    def open(self, remote_path: str, mode: str) -> FakeSFTPFile:
+        """
+        Open a remote file.
+        """
+        return FakeSFTPFile(self.path(remote_path), mode.replace("b", ""))
+
+    def put(self, local_path: str, remote_path: str, confirm: bool) -> None:
+        """
+        Upload a file, slow enough for the other channels to be used.
+        """
+        sleep(0.05)
+        self.uploaded.append(remote_path)
+        with open(local_path, "rb") as source:
+            with open(self.path(remote_path), "wb") as target:
+                target.write(source.read())
+
+    def get(self, remote_path: str, local_path: str) -> None:
+        """
+        Download a file.
+        """
+        with open(self.path(remote_path), "rb") as source:
+            with open(local_path, "wb") as target:
+                target.write(source.read())
+
+    def close(self) -> None:
+        """
+        Close the client.
+        """
+        self.closed = True
+
+
+@pytest.fixture
+def sftp(tmp_path: Path) -> FakeSFTP:
+    """
+    Create a fake SFTP client with an empty remote directory.
+    """
+    remote = tmp_path.joinpath("remote")
+    remote.mkdir()
+    return FakeSFTP(remote)
+
+
+@pytest.fixture
+def session(sftp: FakeSFTP) -> Dict[str, Any]:
+    """
+    Create an SFTP session of the fake client.
+    """
+    return {"sftp": sftp, "channels": [], "created": set()}
+
+
+@pytest.fixture
+def channels(sftp: FakeSFTP) -> Generator[List[FakeSFTP], None, None]:
+    """
+    Open fake SFTP clients as additional channels.
+    """
+    opened: List[FakeSFTP] = []
+
+    def from_transport(transport: Any) -> FakeSFTP:
+        channel = FakeSFTP(sftp.root)
+        opened.append(channel)
+        return channel
+
+    with patch.object(SFTPClient, "from_transport", from_transport):
+        yield opened
+
+
+def test_download_directory(
+    session: Dict[str, Any], channels: List[FakeSFTP], tmp_path: Path
+) -> None:
+    """
+    Test the download_directory function with nested and empty directories.
+    """
+    remote = session["sftp"].root
+    remote.joinpath("tree/a/b").mkdir(parents=True)
+    remote.joinpath("tree/empty/deeper").mkdir(parents=True)
+    remote.joinpath("tree/top.txt").write_text("top")
+    for idx in range(5):
+        remote.joinpath(f"tree/a/b/{idx}.txt").write_text(f"file {idx}")
+    local = tmp_path.joinpath("local")
+
+    download_directory(Path("/tree"), local, session)  # type: ignore
+
+    assert sorted(
+        path.relative_to(local).as_posix() for path in local.rglob("*")
+    ) == [
+        "a",
+        "a/b",
+        "a/b/0.txt",
+        "a/b/1.txt",
+        "a/b/2.txt",
+        "a/b/3.txt",
+        "a/b/4.txt",
+        "empty",
+        "empty/deeper",
+        "top.txt",
+    ]
+    assert local.joinpath("a/b/3.txt").read_text() == "file 3"
+    assert local.joinpath("top.txt").read_text() == "top"
+    assert session["channels"] == channels
+
+
+def test_copy_remote_file_glob_upload(
+    session: Dict[str, Any], channels: List[FakeSFTP], tmp_path: Path
+) -> None:
+    """
+    Test the copy_remote_file function uploading files of a glob.
+    """
+    sftp = session["sftp"]
+    local = tmp_path.joinpath("local")
+    local.mkdir()
+    for idx in range(10):
+        local.joinpath(f"{idx}.txt").write_text(f"file {idx}")
+    local.joinpath("other.csv").write_text("other")
+
+    with patch.object(
+        copy_files_ssh, "_get_sftp_session", return_value=session
+    ):
+        copy_remote_file(MagicMock(), local.joinpath("*.txt"), Path("/target"))
+        opened = len(channels)
+        copy_remote_file(MagicMock(), local.joinpath("*.txt"), Path("/other"))
+
+    assert sorted(os.listdir(sftp.root.joinpath("target"))) == [
+        f"{idx}.txt" for idx in range(10)
+    ]
+    assert sftp.root.joinpath("other/7.txt").read_text() == "file 7"
+    used = [client for client in [sftp, *channels] if client.uploaded]
+    assert len(used) > 1
+    # The channels of the first copy are reused by the second
+    assert 0 < len(channels) < copy_files_ssh.SFTP_CHANNELS
+    assert len(channels) == opened
+    assert session["channels"] == channels
+    assert not any(client.closed for client in [sftp, *channels])
+
+
+def test_run_with_sftp_channels_error(
+    session: Dict[str, Any], channels: List[FakeSFTP]
+) -> None:
+    """
+    Test the run_with_sftp_channels function with a failing job.
+    """
+    finished: List[str] = []
+
+    def job(channel: SFTPClient) -> None:
+        sleep(0.01)
+        finished.append(current_thread().name)
+
+    def failing_job(channel: SFTPClient) -> None:
+        raise ValueError("Transfer failed")
+
+    with pytest.raises(ValueError) as e:
+        run_with_sftp_channels(
+            session, [job, failing_job, job, job]  # type: ignore
+        )
+
+    assert str(e.value) == "Transfer failed"
+    assert len(finished) == 3
+    assert session["channels"] == channels
+
+
+def test_close_client(session: Dict[str, Any]) -> None:
+    """
+    Test the _close_client function closing the SFTP session and channels.
+    """
+    client = MagicMock()
+    session["channels"] = [FakeSFTP(session["sftp"].root) for _ in range(2)]
+    copy_files_ssh._sftp_clients[client] = session  # type: ignore
+
+    _close_client(client)
+
+    assert session["sftp"].closed
+    assert all(channel.closed for channel in session["channels"])
+    client.close.assert_called_once()
+    assert client not in copy_files_ssh._sftp_clients
+
+
+def test_get_client_reconnect() -> None:
+    """
+    Test the _get_client function reconnecting an inactive client.
+    """
+    stale = MagicMock()
+    stale.get_transport.return_value.is_active.return_value = False
+    copy_files_ssh._clients[("user", "host")] = stale
+
+    with patch.object(copy_files_ssh, "SSHClient") as ssh_client:
+        client = _get_client("user", "host", "password")
+
+    assert client is ssh_client.return_value
+    client.connect.assert_called_once_with(
+        "host", username="user", password="password"
+    )
+    stale.close.assert_called_once()
+    assert copy_files_ssh._clients[("user", "host")] is client
+    del copy_files_ssh._clients[("user", "host")]
+
+
+def test_get_client_connect_error() -> None:
+    """
+    Test the _get_client function closing the client if connect fails.
+    """
+    with patch.object(copy_files_ssh, "SSHClient") as ssh_client:
+        ssh_client.return_value.connect.side_effect = OSError("Refused")
+        with pytest.raises(OSError):
+            _get_client("user", "unreachable", "password")
+
+    ssh_client.return_value.close.assert_called_once()
+    assert ("user", "unreachable") not in copy_files_ssh._clients
+
+
+def test_make_remote_dir_existing(sftp: FakeSFTP) -> None:
+    """
+    Test the make_remote_dir function with an existing directory.
+    """
+    sftp.root.joinpath("existing").mkdir()
+    created: Set[str] = set()
+
+    make_remote_dir(sftp, "/existing", created)  # type: ignore
+    make_remote_dir(sftp, "/existing", created)  # type: ignore
+
+    assert created == {"/existing"}
+    assert sftp.requests == ["mkdir"]
+
+
+def test_copy_remote_file_missing_parent(
+    session: Dict[str, Any], tmp_path: Path
+) -> None:
+    """
+    Test the copy_remote_file function without the remote parent directory.
+    """
+    sftp = session["sftp"]
+    tmp_path.joinpath("file.txt").write_text("content")
+
+    with patch.object(
+        copy_files_ssh, "_get_sftp_session", return_value=session
+    ):
+        with pytest.raises(IOError):
+            copy_remote_file(
+                MagicMock(),
+                tmp_path.joinpath("file.txt"),
+                Path("/missing/deeper"),
+            )
+        assert not session["created"]
+
+        # The directory is created again with the next upload
+        sftp.root.joinpath("missing").mkdir()
+        copy_remote_file(
+            MagicMock(), tmp_path.joinpath("file.txt"), Path("/missing/deeper")
+        )
+
+    assert sftp.root.joinpath("missing/deeper/file.txt").read_text() == (
+        "content"
+    )
+    assert session["created"] == {"/missing/deeper"}
@@ -0,0 +1,328 @@
+"""
+This module contains tests for the REST plugin.
+"""
+
+import json
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+from time import sleep
+from typing import Any, Dict, Generator, List
+
+import pytest
+from test_tool_rest_plugin.main import (
+    RestCall,
+    augment_rest_call,
+    default_rest_call,
+    make_rest_call,
+    make_rest_calls,
+    pretty_xml,
+)
+
+# Integers orjson would parse as floats
+BIG_INT = 123456789012345678901234567890
+MIN_INT = -(2**63) - 1
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    A handler answering with json, or plain text on /text.
+    """
+
+    protocol_version = "HTTP/1.1"
+    served: List[str] = []
+    received: Dict[str, str] = {}
+
+    def send(
+        self, body: str, content_type: str, encoding: str = "utf-8"
+    ) -> None:
+        """
+        Send a response with the given body.
+        """
+        content = body.encode(encoding)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """
+        Answer a GET request.
+        """
+        if self.path == "/slow":
+            sleep(0.2)
+            self.served.append(self.path)
+            self.send(json.dumps({"id": 1, "name": "foo"}), "application/json")
+        elif self.path == "/big":
+            self.send(json.dumps({"id": BIG_INT}), "application/json")
+        elif self.path == "/min":
+            self.send(json.dumps({"id": MIN_INT}), "application/json")
+        elif self.path == "/utf16":
+            self.send(
+                json.dumps({"id": 1}),
+                "application/json; charset=utf-16",
+                "utf-16",
+            )
+        elif self.path == "/missing":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/text":
+            self.send("hello", "text/plain")
+        elif self.path == "/cookie":
+            cookie = self.headers.get("Cookie", "")
+            self.send(json.dumps({"cookie": cookie}), "application/json")
+        elif self.path == "/login":
+            self.send_response(200)
+            self.send_header("Set-Cookie", "session=secret; Path=/")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self.send(json.dumps({"id": 1, "name": "foo"}), "application/json")
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        """
+        Answer a POST request with the received Content-Type and body.
+        """
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode()
+        self.received.update(
+            content_type=self.headers.get("Content-Type", ""), body=body
+        )
+        self.send(json.dumps(self.received), "application/json")
+
+    def log_message(self, *args: Any) -> None:
+        """
+        Don't log the requests.
+        """
+
+
+@pytest.fixture(scope="module")
+def base_url() -> Generator[str, None, None]:
+    """
+    Start a local http server for the tests.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def create_call(base_url: str, **kwargs: Any) -> RestCall:
+    """
+    Create and augment a rest call.
+    """
+    call: Dict[str, Any] = deepcopy(default_rest_call)  # type: ignore
+    call["base_url"] = base_url
+    call["path"] = "/"
+    call.update(kwargs)
+    augment_rest_call(call, {}, Path.cwd())  # type: ignore
+    return call  # type: ignore
+
+
+def test_augment_rest_call_invalid_method() -> None:
+    """
+    Test the augment_rest_call function with an unsupported method.
+    """
+    call = deepcopy(default_rest_call)
+    call["method"] = "FOO"  # type: ignore
+
+    with pytest.raises(ValueError) as e:
+        augment_rest_call(call, {}, Path.cwd())
+
+    assert str(e.value) == "Method is not supported."
+
+
+def test_pretty_xml() -> None:
+    """
+    Test the pretty_xml function.
+    """
+    xml = '<?xml version="1.0"?><a><b>1</b><c/><d><e>text</e></d></a>'
+
+    assert pretty_xml(xml) == (
+        '<?xml version="1.0"?>\n'
+        + "<a>\n"
+        + "  <b>1</b>\n"
+        + "  <c/>\n"
+        + "  <d>\n"
+        + "    <e>text</e>\n"
+        + "  </d>\n"
+        + "</a>\n"
+    )
+
+
+def test_make_rest_call_assertion(base_url: str) -> None:
+    """
+    Test the make_rest_call function with a full assertion.
+    """
+    call = create_call(base_url, assertion={"value": {"id": 1, "name": "foo"}})
+
+    make_rest_call(call, {})
+
+
+def test_make_rest_call_assertion_fails(base_url: str) -> None:
+    """
+    Test the make_rest_call function with a wrong full assertion.
+    """
+    call = create_call(base_url, assertion={"value": {"id": 1}})
+
+    with pytest.raises(AssertionError):
+        make_rest_call(call, {})
+
+
+def test_make_rest_call_assertion_big_int(base_url: str) -> None:
+    """
+    Test the make_rest_call function with an integer wider than 64 bits.
+    """
+    call = create_call(
+        base_url, path="/big", assertion={"value": {"id": BIG_INT}}
+    )
+
+    make_rest_call(call, {})
+
+
+def test_make_rest_call_assertion_min_int(base_url: str) -> None:
+    """
+    Test the make_rest_call function with an integer below -2**63.
+    """
+    call = create_call(
+        base_url, path="/min", assertion={"value": {"id": MIN_INT}}
+    )
+
+    make_rest_call(call, {})
+
+
+def test_make_rest_call_assertion_utf16(base_url: str) -> None:
+    """
+    Test the make_rest_call function with a UTF-16 json response.
+    """
+    call = create_call(base_url, path="/utf16", assertion={"value": {"id": 1}})
+
+    make_rest_call(call, {})
+
+
+def test_make_rest_call_only_defined(base_url: str) -> None:
+    """
+    Test the make_rest_call function with only defined keys.
+    """
+    call = create_call(
+        base_url, assertion={"value": {"id": 1}, "only_defined": True}
+    )
+
+    make_rest_call(call, {})
+
+
+def test_make_rest_call_text(base_url: str) -> None:
+    """
+    Test the make_rest_call function with a text response.
+    """
+    call = create_call(
+        base_url,
+        path="/text",
+        response_type="TEXT",
+        assertion={"value": "hello"},
+    )
+
+    make_rest_call(call, {})
+
+
+def test_make_rest_call_text_with_dict_assertion(base_url: str) -> None:
+    """
+    Test the make_rest_call function with a text response and a dict.
+    """
+    call = create_call(base_url, path="/text", assertion={"value": {"id": 1}})
+
+    with pytest.raises(AssertionError):
+        make_rest_call(call, {})
+
+
+def test_make_rest_call_no_cookies_kept(base_url: str) -> None:
+    """
+    Test that cookies of a call are not sent with later calls.
+    """
+    make_rest_call(create_call(base_url, path="/login"), {})
+    call = create_call(
+        base_url,
+        path="/cookie",
+        assertion={"value": {"cookie": ""}},
+    )
+
+    make_rest_call(call, {})
+
+
+def test_make_rest_call_files(base_url: str) -> None:
+    """
+    Test the make_rest_call function with files and multipart.
+    """
+    Path("upload.txt").write_text("file content", encoding="UTF-8")
+    call = create_call(
+        base_url,
+        method="POST",
+        headers={"Content-Type": "application/json"},
+        files={
+            "file": {"path": "upload.txt", "binary": False, "media": "text"}
+        },
+        multipart={"part": {"key": "value"}},
+    )
+
+    make_rest_call(call, {})
+
+    assert call["headers"] == {"Content-Type": "application/json"}
+    assert Handler.received["content_type"].startswith("multipart/form-data")
+    assert "file content" in Handler.received["body"]
+    assert '{"key":"value"}' in Handler.received["body"]
+
+
+def test_make_rest_call_multipart_big_int(base_url: str) -> None:
+    """
+    Test the make_rest_call function with a big integer in a multipart.
+    """
+    call = create_call(
+        base_url, method="POST", multipart={"part": {"n": 10**20}}
+    )
+
+    make_rest_call(call, {})
+
+    assert '{"n": 100000000000000000000}' in Handler.received["body"]
+
+
+def test_make_rest_call_files_without_content_type(base_url: str) -> None:
+    """
+    Test the make_rest_call function with files and no Content-Type.
+    """
+    Path("upload.bin").write_bytes(b"binary content")
+    call = create_call(
+        base_url,
+        method="POST",
+        files={
+            "file": {"path": "upload.bin", "binary": True, "media": "binary"}
+        },
+    )
+
+    make_rest_call(call, {})
+
+
+def test_make_rest_calls_assertion_fails(base_url: str) -> None:
+    """
+    Test the make_rest_calls function raising after all calls finished.
+    """
+    Handler.served.clear()
+    calls = [create_call(base_url, assertion={"value": {"id": 2}})]
+    calls += [create_call(base_url, path="/slow") for _ in range(5)]
+
+    with pytest.raises(AssertionError):
+        make_rest_calls(calls, {})
+
+    assert Handler.served == ["/slow"] * 5
+
+
+def test_make_rest_calls_status_code_fails(base_url: str) -> None:
+    """
+    Test the make_rest_calls function with an unexpected status code.
+    """
+    calls = [create_call(base_url), create_call(base_url, path="/missing")]
+
+    with pytest.raises(AssertionError):
+        make_rest_calls(calls, {})